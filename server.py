@@ -1,162 +1,303 @@
 from mcp.server.fastmcp import FastMCP, Context
-from typing import Optional
+from typing import AsyncIterator, Callable, Hashable, Optional
+from contextlib import asynccontextmanager
+from cachetools import LRUCache, TTLCache
 from dotenv import load_dotenv
+import asyncio
+import functools
+import inspect
 import os
 import httpx
+import orjson
+import simdjson
 
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
 
+# Query parameters shared by every request to an endpoint, merged into the per-call ones.
+_APPID = {"appid": API_KEY}
+_UV_PARAMS = {"daily": "uv_index_max", "timezone": "auto"}
+
+_UNIT_SYMBOL = {"imperial": "°F", "metric": "°C"}
+
+# The forecast is the largest payload but only a few fields of it are used.
+_forecast_parser = simdjson.Parser()
+
+# Shared HTTP clients, reused across tool calls so connections are kept alive
+# instead of paying a fresh TCP/TLS handshake on every request. Both use HTTPS so
+# ALPN can negotiate HTTP/2 and concurrent requests share one connection.
+# Responses are requested compressed; httpx decodes gzip and (with brotli installed) br transparently.
+_limits = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+_headers = {"Accept-Encoding": "gzip, br"}
+
+_owm_client = httpx.AsyncClient(base_url="https://api.openweathermap.org", limits=_limits, headers=_headers, http2=True, timeout=30.0)
+_meteo_client = httpx.AsyncClient(base_url="https://api.open-meteo.com", limits=_limits, headers=_headers, http2=True, timeout=30.0)
+
+_warmup_task: Optional[asyncio.Task] = None
+
+async def _warmup() -> None:
+    """Open a connection to each API up front so the first tool call skips DNS, TCP and TLS setup."""
+    await asyncio.gather(_owm_client.head("/"), _meteo_client.head("/"), return_exceptions=True)
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Start warming up the shared HTTP clients in the background the first time a session opens.
+    FastMCP enters this once per session (once per request in stateless HTTP mode), so later entries do nothing;
+    the clients live for the whole process and are closed by _serve on shutdown."""
+    global _warmup_task
+    if _warmup_task is None:
+        _warmup_task = asyncio.create_task(_warmup())
+    yield
+
+# Response caches, keyed by tool arguments. TTLs follow how quickly each kind of data changes.
+_cw_cache = TTLCache(maxsize=1024, ttl=60)
+_fc_cache = TTLCache(maxsize=1024, ttl=600)
+_aq_cache = TTLCache(maxsize=1024, ttl=600)
+_uv_cache = TTLCache(maxsize=1024, ttl=3600)
+_geo_cache = TTLCache(maxsize=8192, ttl=86400)
+
+def _cached(cache: TTLCache, key_func: Optional[Callable[..., Hashable]] = None):
+    """Serve repeated tool calls from `cache`. Concurrent misses for the same arguments share one fetch; error responses are not cached.
+    If the API fails or is unreachable, the last good response for those arguments is returned instead, prefixed with "(cached)"
+    so the response itself (e.g. the coordinates parsed by _parse_coordinates) is left intact.
+    `key_func`, called with the tool's arguments, can map equivalent calls to one cache key; by default all arguments are used."""
+    def decorator(func):
+        signature = inspect.signature(func)
+        locks: dict[Hashable, asyncio.Lock] = {}
+        users: dict[Hashable, int] = {}
+        stale: LRUCache = LRUCache(maxsize=cache.maxsize)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = key_func(**bound.arguments) if key_func else tuple(bound.arguments.values())
+
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+            # A key's lock is shared by every caller holding or waiting on it, and dropped once the last one is done.
+            lock = locks.setdefault(key, asyncio.Lock())
+            users[key] = users.get(key, 0) + 1
+            try:
+                async with lock:
+                    result = cache.get(key)
+                    if result is None:
+                        try:
+                            result = await func(*args, **kwargs)
+                        except httpx.HTTPError:
+                            if key not in stale:
+                                raise
+                            result = None
+                        if result is not None and not result.startswith("Error"):
+                            cache[key] = stale[key] = result
+                        elif key in stale:
+                            result = f"(cached) {stale[key]}"
+            finally:
+                users[key] -= 1
+                if not users[key]:
+                    del users[key], locks[key]
+            return result
+
+        return wrapper
+    return decorator
+
 # Create an MCP server
-mcp = FastMCP("Weather Service - OpenWeatherMap API")
+mcp = FastMCP("Weather Service - OpenWeatherMap API", lifespan=lifespan)
 
 # Tool implementation
 @mcp.tool()
+@_cached(_cw_cache)
 async def get_current_weather(lat: float, lon: float, units: str) -> str:
     """Get the current weather for a specified location (coordinates). Uses positive float for North latitudes, negative for South latitudes. Uses positive longitude for East longitudes, negative for West longitudes. Imperial units for Fahrenheit, metric for Celsius."""
 
-    url = "http://api.openweathermap.org/data/2.5/weather"
-    params = {
+    path = "/data/2.5/weather"
+    params = _APPID | {
         "lat": lat,
         "lon": lon,
-        "appid": API_KEY,
         "units": units
     }
 
-    unit_symbol = "°F" if units == "imperial" else "°C"
+    unit_symbol = _UNIT_SYMBOL.get(units, "°C")
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        
-        if response.status_code != 200:
-            return f"Error: Could not find weather for '{lat}, {lon}'. (Status: {response.status_code})"
-        
-        data = response.json()
-        temp = data['main']['temp']
-        desc = data['weather'][0]['description']
-        humidity = data['main']['humidity']
-        wind_speed = data['wind']['speed']
-        wind_direction = data['wind']['deg']
+    response = await _owm_client.get(path, params=params)
+    
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        return f"Error: Could not find weather for '{lat}, {lon}'. (Status: {e.response.status_code})"
+    
+    data = orjson.loads(response.content)
+    main = data['main']
+    wind = data['wind']
+    temp = main['temp']
+    desc = data['weather'][0]['description']
+    humidity = main['humidity']
+    wind_speed = wind['speed']
+    wind_direction = wind['deg']
 
-        return f"The current weather in ({lat}, {lon}) is {desc} with a temperature of {temp}{unit_symbol} and humidity of {humidity}%. The wind speed is {wind_speed} m/s at {wind_direction}°."
+    return f"The current weather in ({lat}, {lon}) is {desc} with a temperature of {temp}{unit_symbol} and humidity of {humidity}%. The wind speed is {wind_speed} m/s at {wind_direction}°."
 
 
 @mcp.tool()
+@_cached(_fc_cache)
 async def get_5_day_forecast(lat: float, lon: float, units: str):
     """Get the 5-day weather forecast for a specified location (coordinates). Imperial units for Fahrenheit, metric for Celsius."""
-    url = "http://api.openweathermap.org/data/2.5/forecast"
-    params = {
+    path = "/data/2.5/forecast"
+    params = _APPID | {
         "lat": lat,
         "lon": lon,
-        "appid": API_KEY,
         "units": units
     }
     
-    unit_symbol = "°F" if units == "imperial" else "°C"
+    unit_symbol = _UNIT_SYMBOL.get(units, "°C")
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        
-        if response.status_code != 200:
-            return f"Error: Could not fetch forecast for ({lat}, {lon})."
-        data = response.json()
-        forecast_list = data['list']
-    
-        daily_summaries = []
-        for i in range(0, len(forecast_list), 8):
-            day_data = forecast_list[i]
-            date = day_data['dt_txt'].split(" ")[0]
-            temp = day_data['main']['temp']
-            desc = day_data['weather'][0]['description']
-            humidity = day_data['main']['humidity']
-            wind_speed = day_data['wind']['speed']
-            wind_direction = day_data['wind']['deg']
-    
-            daily_summaries.append(
-                f"{date}: {temp}{unit_symbol}, {desc}. "
-                f"Humidity: {humidity}%, Wind: {wind_speed} m/s at {wind_direction}°"
-            )
-
-        return f"5-Day Forecast for ({lat}, {lon}):\n" + "\n".join(daily_summaries)
+    response = await _owm_client.get(path, params=params)
+    
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError:
+        return f"Error: Could not fetch forecast for ({lat}, {lon})."
+    # One slot per day: the API returns 3-hour steps, 8 per day. simdjson parses
+    # lazily, so only these slots are turned into Python objects. Nothing may keep
+    # a reference into the parsed document, or the shared parser cannot be reused.
+    forecast_days = _forecast_parser.parse(response.content)['list'][::8]
+
+    daily_summaries = "\n".join(_format_forecast_day(day_data, unit_symbol) for day_data in forecast_days)
+
+    return f"5-Day Forecast for ({lat}, {lon}):\n{daily_summaries}"
+
+def _format_forecast_day(day_data: dict, unit_symbol: str) -> str:
+    """Format one forecast slot as a single summary line."""
+    main = day_data['main']
+    wind = day_data['wind']
+    date = day_data['dt_txt'].split(" ")[0]
+    temp = main['temp']
+    desc = day_data['weather'][0]['description']
+    humidity = main['humidity']
+    wind_speed = wind['speed']
+    wind_direction = wind['deg']
+
+    return (
+        f"{date}: {temp}{unit_symbol}, {desc}. "
+        f"Humidity: {humidity}%, Wind: {wind_speed} m/s at {wind_direction}°"
+    )
 
 @mcp.tool()
+@_cached(_aq_cache)
 async def get_air_quality(lat: float, lon: float):
     """Get the air quality for a specified location (coordinates)."""
-    url = "http://api.openweathermap.org/data/2.5/air_pollution"
-    params = {
+    path = "/data/2.5/air_pollution"
+    params = _APPID | {
         "lat": lat,
         "lon": lon,
-        "appid": API_KEY,
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        
-        if response.status_code != 200:
-            return f"Error: Could not fetch air quality data for coordinates ({lat}, {lon})."
-        
-        data = response.json()
-        aqi = data['list'][0]['main']['aqi']
-        return f"The air quality index at coordinates ({lat}, {lon}) is {aqi}."
+    response = await _owm_client.get(path, params=params)
+    
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError:
+        return f"Error: Could not fetch air quality data for coordinates ({lat}, {lon})."
+    
+    data = orjson.loads(response.content)
+    aqi = data['list'][0]['main']['aqi']
+    return f"The air quality index at coordinates ({lat}, {lon}) is {aqi}."
 
 @mcp.tool()
+@_cached(_uv_cache)
 async def get_uv_index(lat: float, lon: float) -> str:
     """Get the UV index for a specified location (coordinates)."""
 
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
+    path = "/v1/forecast"
+    params = _UV_PARAMS | {
         "latitude": lat,
         "longitude": lon,
-        "daily": "uv_index_max",
-        "timezone": "auto"
     }
     
-    async with httpx.AsyncClient() as client:
-        res = await client.get(url, params=params)
-        data = res.json()
-        uv_max = data['daily']['uv_index_max'][0]
+    res = await _meteo_client.get(path, params=params)
+    
+    try:
+        res.raise_for_status()
+    except httpx.HTTPStatusError:
+        return f"Error: Could not fetch UV index for ({lat}, {lon})."
+    
+    data = orjson.loads(res.content)
+    uv_max = data['daily']['uv_index_max'][0]
 
     return f"The maximum UV index at coordinates ({lat}, {lon}) today is {uv_max}."
 
 @mcp.tool()
+@_cached(_geo_cache, key_func=lambda location: location.strip().lower())
 async def get_coordinates(location: str) -> str:
     """
     Converts a location name (city, state, country) into latitude and longitude.
     Example input: 'Blue Mountain, Ontario, Canada'
     """
-    url = "http://api.openweathermap.org/geo/1.0/direct"
-    params = {
+    path = "/geo/1.0/direct"
+    params = _APPID | {
         "q": location,
         "limit": 1,
-        "appid": API_KEY
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        
-        if response.status_code != 200:
-            return f"Error: API call failed with status {response.status_code}"
-            
-        data = response.json()
-        
-        if not data:
-            return f"Error: Could not find coordinates for '{location}'."
-        
-        place = data[0]
-        lat = place['lat']
-        lon = place['lon']
-        name = place['name']
-        state = place.get('state', 'N/A')
+    response = await _owm_client.get(path, params=params)
+    
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        return f"Error: API call failed with status {e.response.status_code}"
         
-        return f"Location: {name}, {state} | Latitude: {lat}, Longitude: {lon}"
+    data = orjson.loads(response.content)
+    
+    if not data:
+        return f"Error: Could not find coordinates for '{location}'."
+    
+    place = data[0]
+    lat = place['lat']
+    lon = place['lon']
+    name = place['name']
+    state = place.get('state', 'N/A')
+    
+    return f"Location: {name}, {state} | Latitude: {lat}, Longitude: {lon}"
+
+def _parse_coordinates(coordinates: str) -> tuple[float, float]:
+    """Extract (lat, lon) from the string returned by get_coordinates."""
+    _, _, lat_lon = coordinates.rpartition("Latitude: ")
+    lat, _, lon = lat_lon.partition(", Longitude: ")
+    return float(lat), float(lon)
+
+@mcp.tool()
+async def get_outfit_context(city: str, units: str = "metric") -> str:
+    """Get everything needed to plan an outfit for a city in one call: its coordinates, current weather, 5-day forecast and UV index. Imperial units for Fahrenheit, metric for Celsius."""
+
+    coordinates = await get_coordinates(city)
+    if coordinates.startswith("Error"):
+        return coordinates
+    lat, lon = _parse_coordinates(coordinates)
+
+    current_weather, forecast, uv_index = await asyncio.gather(
+        get_current_weather(lat, lon, units),
+        get_5_day_forecast(lat, lon, units),
+        get_uv_index(lat, lon),
+    )
+
+    return "\n\n".join((coordinates, current_weather, forecast, uv_index))
     
 # tool with sampling - not quite sure if this will work well due to the recursive nature.
 @mcp.tool()
 async def get_location_recommendation(city: str, region: str, vacation_type: Optional[str], ctx: Context) -> str:
     """User provides city they are planning to visit and region for their vacation. Checks weather conditions in coming few days and compares if the city would be good to visit for intended vacation type. If not, suggests an alternative city in the same region with better weather conditions for the vacation type."""
 
-    lat, lon = await ctx.call_tool("get_coordinates", city)
-    current_weather_data = await get_current_weather(city, "metric")
-    weather_data_5_days = await get_5_day_forecast(city, "metric")
+    coordinates = await get_coordinates(city)
+    if coordinates.startswith("Error"):
+        return coordinates
+    lat, lon = _parse_coordinates(coordinates)
+
+    # Both weather lookups only depend on the coordinates, so fetch them concurrently.
+    current_weather_data, weather_data_5_days = await asyncio.gather(
+        get_current_weather(lat, lon, "metric"),
+        get_5_day_forecast(lat, lon, "metric"),
+    )
 
     result = await ctx.sample(
         f"""The user is planning a {vacation_type} vacation in {city}, {region}. 
@@ -187,17 +328,27 @@ def outfit_planner(city: str) -> str:
     """Prepares a clothing recommendation for the user!"""
     return f"""
     Please perform a comprehensive environmental check for {city}:
-    1. Call 'get_coordinates' to get latitude and longitude.
-    2. Use those coordinates to:
-     - Call 'get_current_weather' for immediate conditions. Check all parameters including temperature, humidity, and wind.
-     - Call 'get_5_day_forecast' to see if conditions will change soon.
-     - Call 'get_uv_index' to check for sun protection needs.
+    1. Call 'get_outfit_context' once; it returns the location, current weather, 5-day forecast and UV index together.
+    2. From that data:
+     - Check the current conditions, including temperature, humidity, and wind.
+     - Check the forecast to see if conditions will change soon.
+     - Check the UV index for sun protection needs.
     
     Based on all this data, give me a detailed 'What to Wear' list. 
     Be specific about layers, footwear, and accessories like sunglasses or umbrellas. You can ask the user followup questions including their type of clothing style eg baggy, loose, formal, etc.
     """
 
 
+async def _serve() -> None:
+    """Run the server over stdio and close the shared HTTP clients once, when it stops."""
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        if _warmup_task is not None:
+            _warmup_task.cancel()
+        await _owm_client.aclose()
+        await _meteo_client.aclose()
+
 # Run server
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    asyncio.run(_serve())
\ No newline at end of file